@@ -6,20 +6,27 @@
 # 
 # You should have received a copy of the GNU General Public License along with pybinds. If not, see <https://www.gnu.org/licenses/>. 
 
-from dataclasses import dataclass
+import os
+import select
+import time
+import weakref
 
-from Xlib.X import Expose, KeyPress, KeyRelease
+from typing import TYPE_CHECKING, Callable, Optional
+
+from Xlib.X import Expose, KeyPress, KeyRelease, MappingNotify
 
 from Xlib.XK import XK_Shift_L, XK_Shift_R
+from Xlib.error import ConnectionClosedError
+from Xlib.protocol.rq import Event
 
-from bind_node import BindNode, Command, Keybind
+from bind_node import BindNode, Command
+from command_output import OutputStream
+from configs import ActionHandlerConfig, KeyHandlerConfig, VisualsHandlerConfig
 from text_rendering import TextRenderer
-from draw_bar import DrawManager, DrawingConfig, XOrgHandler
+from draw_bar import DrawManager, XOrgHandler
 
-@dataclass
-class VisualsHandlerConfig:
-    separator: str
-    drawing_config: DrawingConfig
+if TYPE_CHECKING:
+    from PIL.Image import Image
 
 class VisualsHandler:
     def __init__(
@@ -36,12 +43,33 @@ class VisualsHandler:
 
         self.__drawer: DrawManager
 
+        # Latest output line of a command, drawn at the right end of the bar whatever the node
+        self.__status_image: Optional["Image"] = None
+        self.__status_width_drawn = 0
+
+        # Layouts are specific to this display's bar, so they are cached here and not in the renderers.
+        # They are tagged with the node's version, since generated or included children may change.
+        # Weak keys let the layouts of children replaced that way go away along with them
+        self.__drawers: weakref.WeakKeyDictionary[BindNode, tuple[int, DrawManager]] = weakref.WeakKeyDictionary()
+
         self.update_node(root)
 
     def update_node(self, node: BindNode) -> None:
         """
-        Render texts and update drawer.
+        Update drawer, rendering texts if the node has not been visited yet.
         """
+        version = node.get_version()
+        cached = self.__drawers.get(node)
+
+        if cached is not None and cached[0] == version:
+            drawer = cached[1]
+        else:
+            drawer = self.__create_drawer(node)
+            self.__drawers[node] = (version, drawer)
+
+        self.__drawer = drawer
+
+    def __create_drawer(self, node: BindNode) -> DrawManager:
         separator_image = self.__renderers["separator"].render(self.__separator)
 
         children = node.get_all_children()
@@ -49,7 +77,7 @@ class VisualsHandler:
         key_images = [self.__renderers["keys"].render(str(child.get_key())) for child in children]
         text_images = [self.__renderers["texts"].render(str(child.get_name())) for child in children]
 
-        self.__drawer = DrawManager(
+        return DrawManager(
             xorg_handler=self.__xorg_handler,
             separator_image = separator_image,
             key_images = key_images,
@@ -57,14 +85,41 @@ class VisualsHandler:
             config = self.__drawing_config
         )
 
+    def set_status(self, text: str) -> None:
+        self.__status_image = self.__renderers["texts"].render(text)
+
+    def draw_status(self) -> None:
+        """Draws the status line over the previous one, leaving the rest of the bar as it is"""
+        width, height = self.__xorg_handler.get_dimensions_in_pixels()
+        right_margin = self.__drawing_config.initial_padding_in_pixels
+
+        if self.__status_width_drawn > 0:
+            x = width - right_margin - self.__status_width_drawn
+            self.__xorg_handler.clear(x, self.__status_width_drawn)
+
+            # Only happens with very long lines, but then the keybinds need to be drawn again
+            if x < self.__drawer.get_right_end():
+                self.__drawer.draw()
+
+        self.__status_width_drawn = 0
+        if self.__status_image is None:
+            return
+
+        image_width, image_height = self.__status_image.size
+        self.__xorg_handler.bar.put_pil_image(
+            gc = self.__xorg_handler.gc,
+            x = width - right_margin - image_width,
+            y = height - image_height,
+            image = self.__status_image
+        )
+        self.__status_width_drawn = image_width
+
     def draw(self):
         self.__drawer.draw()
 
-@dataclass
-class KeyHandlerConfig:
-    back_keys: list[Keybind]
-    exit_keys: list[Keybind]
-
+        # The whole bar may have been cleared, so there's nothing to clear for the status
+        self.__status_width_drawn = 0
+        self.draw_status()
 
 class ExitProgram:
     pass
@@ -80,15 +135,20 @@ class KeyHandler:
 
         self.__xorg_handler = xorg_handler
 
-        self.__shift_keycodes = {
-            self.__keysym_to_keycode(XK_Shift_L), self.__keysym_to_keycode(XK_Shift_R)
-        }
+        self.__shift_keycodes: set[int]
+        self.refresh_keycodes()
 
         # Sets for faster lookup
         self.__back_keys = set(map(hash, config.back_keys))
         self.__exit_keys = set(map(hash, config.exit_keys))
         self.update_node(root)
 
+    def refresh_keycodes(self) -> None:
+        """Looks up the keycodes this handler cares about in the (locally cached) keyboard mapping"""
+        self.__shift_keycodes = {
+            self.__keysym_to_keycode(XK_Shift_L), self.__keysym_to_keycode(XK_Shift_R)
+        }
+
     def __keycode_to_keysym(self, keycode: int) -> int:
         return self.__xorg_handler.keycode_to_keysym(keycode, is_shifted=self.__is_shifted)
 
@@ -123,12 +183,6 @@ class KeyHandler:
         self.__current_node = node
         self.__children_hashmap = {hash(child.get_key()):child for child in node.get_all_children()}
 
-@dataclass
-class ActionHandlerConfig:
-    visuals_config: VisualsHandlerConfig
-    key_config: KeyHandlerConfig
-    shell: str
-
 class ActionHandler:
     def __init__(
             self,
@@ -139,8 +193,12 @@ class ActionHandler:
         ) -> None:
 
         self.__current_node = root
+        self.__current_version = root.get_version()
         self.__xorg_handler = xorg_handler
 
+        self.__update_callback: Callable[[], None] = lambda: None
+        root.enter(self.__notify_update)
+
         self.__visuals_handler = VisualsHandler(
             root = self.__current_node,
             renderers = renderers,
@@ -152,19 +210,81 @@ class ActionHandler:
 
         self.__shell = config.shell
 
+        # Commands picked on this bar must open on this bar's display, not on pybinds' $DISPLAY
+        self.__env = {**os.environ, "DISPLAY": xorg_handler.get_display_name()}
+
+        self.__output_config = config.output_config
+        self.__output: Optional[OutputStream] = None
+
     def __execute(self, cmd: Command):
-        cmd.execute(shell = self.__shell)
+        process = cmd.execute(shell = self.__shell, env = self.__env)
+
+        if process is not None:
+            # Only the last command's output is shown, and the previous command is stopped
+            if self.__output is not None:
+                self.__output.close()
+
+            self.__output = OutputStream(process, self.__output_config)
+
+    def output_fileno(self) -> Optional[int]:
+        """File descriptor to select() on for command output, if there's any left to read"""
+        if self.__output is None or self.__output.is_closed():
+            return None
+
+        return self.__output.fileno()
+
+    def output_deadline(self) -> Optional[float]:
+        """time.monotonic() at which update_output() will have something to draw, if any"""
+        return None if self.__output is None else self.__output.next_deadline()
+
+    def read_output(self):
+        if self.__output is not None:
+            self.__output.read()
+
+    def update_output(self):
+        """Draws the latest output line, if it has changed and the rate limit allows it"""
+        if self.__output is None:
+            return
+
+        line = self.__output.take_line()
+        if line is not None:
+            self.__visuals_handler.set_status(line)
+            self.__visuals_handler.draw_status()
+            self.__xorg_handler.flush()
+
+        if self.__output.is_closed() and self.__output.next_deadline() is None:
+            self.__output = None
+
+    def __notify_update(self):
+        # Called from generator threads, so it must not touch X itself
+        self.__update_callback()
+
+    def set_update_callback(self, callback: Callable[[], None]):
+        """callback is called, from any thread, whenever refresh() may have something to redraw"""
+        self.__update_callback = callback
+
+    def __show(self, node: BindNode):
+        self.__current_version = node.get_version()
+
+        self.__visuals_handler.update_node(node)
+        self.__key_handler.update_node(node)
+
+        self.__xorg_handler.request_redraw()
+
+        self.__visuals_handler.draw()
+
+        self.__current_node = node
 
     def __navigate(self, node: BindNode):
         if node is not self.__current_node:
-            self.__visuals_handler.update_node(node)
-            self.__key_handler.update_node(node)
+            node.enter(self.__notify_update)
+            self.__show(node)
 
-            self.__xorg_handler.request_redraw()
-
-            self.__visuals_handler.draw()
-            
-            self.__current_node = node
+    def refresh(self):
+        """Redraws the current node if its children have changed since it was shown"""
+        if self.__current_node.get_version() != self.__current_version:
+            self.__show(self.__current_node)
+            self.__xorg_handler.flush()
 
     def __handle_expose_event(self):
         self.__visuals_handler.draw()
@@ -178,7 +298,7 @@ class ActionHandler:
             return False
         elif isinstance(action, Command):
             self.__execute(action)
-            return not action.keep_running()
+            return not (action.keep_running() or action.show_output())
         elif isinstance(action, ExitProgram):
             return True
         else:
@@ -187,20 +307,154 @@ class ActionHandler:
     def __handle_keyrelease_event(self, keycode: int):
         self.__key_handler.resolve_keyrelease(keycode)
 
+    def __handle_mapping_notify_event(self, event: Event):
+        self.__xorg_handler.refresh_keyboard_mapping(event)
+        self.__key_handler.refresh_keycodes()
+
     def grab_keyboard(self):
         self.__xorg_handler.grab_keyboard()
 
+    def handle_next_event(self) -> bool:
+        """Blocks until an event arrives and handles it. Returns whether to exit the program"""
+        event = self.__xorg_handler.next_event()
+
+        event_type = event.type
+        if event_type == Expose:
+            self.__handle_expose_event()
+        elif event_type == KeyPress:
+            return self.__handle_keypress_event(event.detail)
+        elif event_type == KeyRelease:
+            self.__handle_keyrelease_event(event.detail)
+        elif event_type == MappingNotify:
+            self.__handle_mapping_notify_event(event)
+
+        return False
+
+    def handle_pending_events(self) -> bool:
+        """Handles every event that has already been received. Returns whether to exit the program"""
+        while self.__xorg_handler.pending_events() > 0:
+            if self.handle_next_event():
+                return True
+
+        return False
+
+    def fileno(self) -> int:
+        return self.__xorg_handler.fileno()
+
+    def get_display_name(self) -> str:
+        return self.__xorg_handler.get_display_name()
+
+    def close(self):
+        if self.__output is not None:
+            self.__output.close()
+
+        self.__xorg_handler.close()
+
     def loop(self):
+        ActionHandlerPool([self]).loop()
+
+class ActionHandlerPool:
+    """
+    Drives one ActionHandler per X display from a single process.
+
+    The handlers are expected to share their BindNode tree and TextRenderers, so that every
+    extra display only costs its own connection, windows and layouts. A display is closed
+    as soon as its handler decides to exit, or dropped if its X server goes away; the pool
+    returns once all of them are gone.
+    """
+    def __init__(self, handlers: list[ActionHandler]) -> None:
+        self.__handlers = {handler.fileno(): handler for handler in handlers}
+
+        # Self-pipe to wake the loop up when generated children arrive from another thread.
+        # It is never closed, since generator threads may still be writing to it while exiting
+        self.__wake_read, self.__wake_write = os.pipe()
+        os.set_blocking(self.__wake_read, False)
+        os.set_blocking(self.__wake_write, False)
+
+        for handler in handlers:
+            handler.set_update_callback(self.__wake)
+
+    def __wake(self):
+        try:
+            os.write(self.__wake_write, b"\0")
+        except BlockingIOError:
+            # The pipe is full, so the loop is going to wake up anyway
+            pass
+
+    def __refresh(self):
         while True:
-            event = self.__xorg_handler.next_event()
+            try:
+                if not os.read(self.__wake_read, 4096):
+                    break
+            except BlockingIOError:
+                break
 
-            event_type = event.type
-            if event_type == Expose:
-                self.__handle_expose_event()
+        for fd in list(self.__handlers):
+            self.__run(fd, lambda handler: handler.refresh())
 
-            elif event_type == KeyPress:
-                exit_program = self.__handle_keypress_event(event.detail)
-                if exit_program:
-                    break
-            elif event_type == KeyRelease:
-                self.__handle_keyrelease_event(event.detail)
+    def grab_keyboard(self):
+        for fd in list(self.__handlers):
+            self.__run(fd, lambda handler: handler.grab_keyboard())
+
+    def __close(self, fd: int):
+        self.__handlers.pop(fd).close()
+
+    def __run(self, fd: int, action: Callable[[ActionHandler], Optional[bool]]) -> None:
+        """
+        Runs action on the handler of fd, closing it if action returns True. A lost connection
+        only takes that handler down, not the whole pool.
+        """
+        handler = self.__handlers.get(fd)
+        if handler is None:
+            return
+
+        try:
+            if action(handler):
+                self.__close(fd)
+        except ConnectionClosedError as e:
+            print(f"WARNING: Lost connection to display {handler.get_display_name()}: {e}")
+            self.__handlers.pop(fd)
+            try:
+                handler.close()
+            except ConnectionClosedError:
+                pass
+
+    def __timeout(self) -> Optional[float]:
+        """How long select() may block before some rate-limited output is due to be drawn"""
+        deadlines = [
+            deadline for handler in self.__handlers.values()
+            if (deadline := handler.output_deadline()) is not None
+        ]
+
+        if not deadlines:
+            return None
+
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def loop(self):
+        # Events may already be queued by Xlib, and children generated, before we ever select()
+        self.__refresh()
+        for fd in list(self.__handlers):
+            self.__run(fd, lambda handler: handler.handle_pending_events())
+
+        while self.__handlers:
+            # Output pipe -> X connection of the handler it belongs to
+            outputs = {
+                output_fd: fd for fd, handler in self.__handlers.items()
+                if (output_fd := handler.output_fileno()) is not None
+            }
+
+            readable, _, _ = select.select(
+                list(self.__handlers) + list(outputs) + [self.__wake_read], [], [], self.__timeout()
+            )
+
+            for fd in readable:
+                if fd == self.__wake_read:
+                    self.__refresh()
+                elif fd in outputs:
+                    self.__run(outputs[fd], lambda handler: handler.read_output())
+                else:
+                    self.__run(fd, lambda handler: handler.handle_pending_events())
+
+            for fd in list(self.__handlers):
+                self.__run(fd, lambda handler: handler.update_output())
@@ -7,28 +7,55 @@
 # You should have received a copy of the GNU General Public License along with pybinds. If not, see <https://www.gnu.org/licenses/>. 
 
 import shlex
-import subprocess
+import threading
+import time
 
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Optional
 
 from Xlib.XK import keysym_to_string, string_to_keysym
 
+if TYPE_CHECKING:
+    from subprocess import Popen
+
 @dataclass()
 class Command:
-    def __init__(self, cmd: str, keep_running: bool = False):
+    def __init__(self, cmd: str, keep_running: bool = False, show_output: bool = False):
         self.__command = self.__create_command(cmd)
         self.__keep_running = keep_running
+        self.__show_output = show_output
 
     def __create_command(self, cmd: str) -> list[str]:
         return shlex.split(shlex.quote(cmd))
 
-    def execute(self, shell: str):
-        subprocess.Popen([shell, "-c"] + self.__command)
-        
+    def execute(self, shell: str, env: Optional[dict[str, str]] = None) -> Optional["Popen[bytes]"]:
+        """
+        Returns the command's process, with its stdout piped, if its output is to be shown, None otherwise.
+        env replaces pybinds' own environment when given.
+        """
+        import subprocess
+
+        if not self.__show_output:
+            subprocess.Popen([shell, "-c"] + self.__command, env=env)
+            return None
+
+        # In a session of its own, so that whatever it starts can be stopped along with it
+        return subprocess.Popen(
+            [shell, "-c"] + self.__command,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            start_new_session=True
+        )
+
     def keep_running(self):
         return self.__keep_running
 
+    def show_output(self):
+        """Commands whose output is shown keep the bar open, otherwise there'd be nowhere to show it"""
+        return self.__show_output
+
     def __repr__(self):
         return f"Command({self.__command})"
 
@@ -52,12 +79,101 @@ class Keybind:
     def __str__(self) -> str:
         return self.__string
 
+@dataclass
+class GeneratorData:
+    """
+    Children produced by running command: one child per non-empty line of its output, named after
+    the line and bound to the next unused character of keys. If child_command is given, each child
+    runs it with {} replaced by its (shell-quoted) line.
+    """
+    command: str
+    shell: str
+    child_command: Optional[str]
+    keep_running: bool
+    ttl_in_seconds: float
+    timeout_in_seconds: float
+    keys: str
+
+class ChildrenGenerator:
+    """
+    Runs a GeneratorData command in a background thread and caches nothing itself: results are
+    handed to a callback, and a new run is only allowed once the previous one is ttl_in_seconds old.
+
+    The generated children are shared by every display, so the command runs in pybinds' own
+    environment, i.e. against the default $DISPLAY, whichever display entered the group.
+    """
+    def __init__(self, data: GeneratorData):
+        self.__data = data
+        self.__lock = threading.Lock()
+        self.__refreshing = False
+        self.__expires_at = 0.0
+
+    def __is_stale(self) -> bool:
+        return time.monotonic() >= self.__expires_at
+
+    def refresh_async(self, on_result: Callable[[list["BindNodeData"]], None]) -> None:
+        """Starts a run unless one is in progress or the last one is still fresh"""
+        with self.__lock:
+            if self.__refreshing or not self.__is_stale():
+                return
+            self.__refreshing = True
+
+        threading.Thread(target=self.__refresh, args=(on_result,), daemon=True).start()
+
+    def __refresh(self, on_result: Callable[[list["BindNodeData"]], None]) -> None:
+        import subprocess
+
+        try:
+            # Without a timeout, a generator waiting for e.g. credentials would block this group forever
+            process = subprocess.run(
+                [self.__data.shell, "-c", self.__data.command],
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                text=True,
+                check=True,
+                timeout=self.__data.timeout_in_seconds
+            )
+            on_result(self.__parse(process.stdout))
+        except subprocess.TimeoutExpired:
+            print(f"WARNING: Generator \"{self.__data.command}\" timed out after {self.__data.timeout_in_seconds}s")
+        except (OSError, subprocess.SubprocessError) as e:
+            # Keep whatever children were there; retrying right away would most likely fail again
+            print(f"WARNING: Generator \"{self.__data.command}\" failed: {e}")
+        finally:
+            with self.__lock:
+                self.__refreshing = False
+                self.__expires_at = time.monotonic() + self.__data.ttl_in_seconds
+
+    def __parse(self, output: str) -> list["BindNodeData"]:
+        lines = filter(lambda line: len(line)>0, map(lambda line: line.strip(), output.splitlines()))
+
+        children = []
+        for key, line in zip(self.__data.keys, lines):
+            command = None
+            if self.__data.child_command is not None:
+                command = Command(self.__data.child_command.replace("{}", shlex.quote(line)), self.__data.keep_running)
+
+            children.append(BindNodeData(name=line, key=Keybind(key), command=command, children=[]))
+
+        return children
+
+@dataclass
+class IncludeData:
+    """
+    Children read from another bindings file. load returns the file's modification time along
+    with its children, and is only called once the group is entered.
+    """
+    path: Path
+    load: Callable[[Path], tuple[int, list["BindNodeData"]]]
+
 @dataclass()
 class BindNodeData:
     name: str
     key: Keybind
     command: Optional[Command]
     children: list ["BindNodeData"]
+    generator: Optional[GeneratorData] = field(default=None)
+    include: Optional[IncludeData] = field(default=None)
 
 class BindNode:
     def __init__(self, data: BindNodeData):
@@ -68,19 +184,72 @@ class BindNode:
 
         self.__command: Optional[Command] = data.command
 
+        # Bumped whenever the children change, so that anything derived from them can be rebuilt
+        self.__version = 0
+        self.__children_index: dict[Keybind, BindNode] = {}
+        self.__set_children(data.children)
+
+        self.__generator: Optional[ChildrenGenerator] = None
+        if data.generator is not None:
+            self.__generator = ChildrenGenerator(data.generator)
+
+        self.__include: Optional[IncludeData] = data.include
+        self.__include_mtime: Optional[int] = None
+
+    def __set_children(self, children_data: list[BindNodeData]) -> None:
         children = list(
             map(
                 lambda child_data: BindNode(child_data),
-                data.children
+                children_data
             )
         )
 
         for child in children:
             child._parent = self
 
-        self.__children_index: dict[Keybind, BindNode] = {
+        # Replaced rather than updated, since generators call this from their own thread
+        self.__children_index = {
             child._key: child for child in children
         }
+        self.__version += 1
+
+    def enter(self, on_update: Callable[[], None]) -> None:
+        """
+        To be called whenever the node is shown. Included files are (re)read right away. Generated
+        children are kept as they are and refreshed in the background if stale; on_update is then
+        called from that background thread.
+        """
+        if self.__include is not None:
+            try:
+                self.load_include()
+            except (OSError, ValueError) as e:
+                # Keep the children from the last good version rather than taking the bar down
+                print(f"WARNING: Unable to load bindings from {self.__include.path}: {e!r}")
+
+        if self.__generator is None:
+            return
+
+        def on_result(children_data: list[BindNodeData]):
+            self.__set_children(children_data)
+            on_update()
+
+        self.__generator.refresh_async(on_result)
+
+    def load_include(self) -> None:
+        """Reads the included file if it has changed since it was last read. Raises on invalid files"""
+        if self.__include is None:
+            return
+
+        mtime, children_data = self.__include.load(self.__include.path)
+        if mtime != self.__include_mtime:
+            self.__set_children(children_data)
+            self.__include_mtime = mtime
+
+    def get_include_path(self) -> Optional[Path]:
+        return None if self.__include is None else self.__include.path
+
+    def get_version(self) -> int:
+        return self.__version
 
     def get_child(self, key: Keybind) -> Optional["BindNode"]:
         return self.__children_index.get(key)
@@ -118,3 +287,25 @@ class BindNode:
 
     def get_command(self) -> Optional[Command]:
         return self.__command
+
+def load_all_includes(root: BindNode) -> dict[Path, BindNode]:
+    """
+    Reads every included file reachable from root, which are otherwise only read on demand.
+    Each file is read once, which also stops files that include each other. Returns the node
+    including each file. Raises on invalid files.
+    """
+    includes: dict[Path, BindNode] = {}
+    pending = [root]
+    while pending:
+        node = pending.pop()
+
+        include_path = node.get_include_path()
+        if include_path is not None:
+            if include_path in includes:
+                continue
+            includes[include_path] = node
+            node.load_include()
+
+        pending.extend(node.get_all_children())
+
+    return includes
@@ -0,0 +1,135 @@
+# This file is part of pybinds.
+# 
+# pybinds is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# 
+# pybinds is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with pybinds. If not, see <https://www.gnu.org/licenses/>. 
+
+import os
+import signal
+import subprocess
+import time
+
+from typing import Optional
+
+from configs import OutputConfig
+
+class OutputStream:
+    """
+    Keeps track of the most recent line a process has written to its stdout, without ever blocking.
+    The process is stopped once its output is no longer shown, i.e. when the stream is closed.
+
+    read() is meant to be called whenever the pipe is readable, and consumes at most a bounded
+    amount of data. take_line() hands out the latest line no more often than the configured rate,
+    so a chatty process can't cause more redraws than that.
+    """
+    # Bounds on how much is read per call and kept around while waiting for a newline
+    READ_SIZE = 4096
+    MAX_READS_PER_CALL = 16
+
+    # How long a process gets to exit after SIGTERM before it is killed
+    STOP_TIMEOUT_IN_SECONDS = 1
+
+    def __init__(self, process: "subprocess.Popen[bytes]", config: OutputConfig):
+        assert process.stdout is not None
+
+        self.__process = process
+        self.__stdout = process.stdout
+        self.__fd = self.__stdout.fileno()
+        os.set_blocking(self.__fd, False)
+
+        self.__max_line_length = config.max_line_length
+        self.__min_interval = 1 / config.max_redraws_per_second
+
+        self.__partial = b""
+        self.__line: Optional[str] = None
+        self.__changed = False
+        self.__last_taken = float("-inf")
+        self.__closed = False
+
+    def fileno(self) -> int:
+        return self.__fd
+
+    def is_closed(self) -> bool:
+        return self.__closed
+
+    def read(self) -> None:
+        if self.__closed:
+            return
+
+        for _ in range(self.MAX_READS_PER_CALL):
+            try:
+                data = os.read(self.__fd, self.READ_SIZE)
+            except BlockingIOError:
+                return
+
+            if not data:
+                # Whatever was left without a newline is the last line
+                self.__set_line(self.__partial)
+                self.__finish()
+                return
+
+            *lines, self.__partial = (self.__partial + data).split(b"\n")
+            self.__partial = self.__partial[-self.READ_SIZE:]
+
+            complete = [line for line in lines if line.strip()]
+            if complete:
+                self.__set_line(complete[-1])
+
+    def __set_line(self, line: bytes) -> None:
+        text = line.decode(errors="replace").strip()
+        if not text:
+            return
+
+        if len(text) > self.__max_line_length:
+            text = text[:self.__max_line_length - 1] + "…"
+
+        if text != self.__line:
+            self.__line = text
+            self.__changed = True
+
+    def next_deadline(self) -> Optional[float]:
+        """time.monotonic() at which take_line() will have a pending line to give, if any"""
+        if not self.__changed:
+            return None
+
+        return self.__last_taken + self.__min_interval
+
+    def take_line(self) -> Optional[str]:
+        """The latest line if it has changed since last taken and the rate limit allows it"""
+        now = time.monotonic()
+        if not self.__changed or now < self.__last_taken + self.__min_interval:
+            return None
+
+        self.__changed = False
+        self.__last_taken = now
+
+        return self.__line
+
+    def __finish(self) -> None:
+        """Stops reading at the end of the output. The process has usually exited by then, and is reaped"""
+        if not self.__closed:
+            self.__closed = True
+            self.__stdout.close()
+
+        self.__process.poll()
+
+    def close(self) -> None:
+        """Stops reading, and stops the process and everything it started if it's still running"""
+        self.__finish()
+        if self.__process.returncode is not None:
+            return
+
+        self.__signal(signal.SIGTERM)
+        try:
+            self.__process.wait(timeout = self.STOP_TIMEOUT_IN_SECONDS)
+        except subprocess.TimeoutExpired:
+            self.__signal(signal.SIGKILL)
+            self.__process.wait()
+
+    def __signal(self, signum: int) -> None:
+        try:
+            os.killpg(self.__process.pid, signum)
+        except ProcessLookupError:
+            pass
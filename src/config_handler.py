@@ -6,28 +6,40 @@
 # 
 # You should have received a copy of the GNU General Public License along with pybinds. If not, see <https://www.gnu.org/licenses/>. 
 
-import subprocess
 import json
+import threading
 
 from pathlib import Path
-from typing import Any
-
-from action_handler import ActionHandlerConfig, KeyHandlerConfig, VisualsHandlerConfig
-from draw_bar import DrawingConfig, XOrgConfig
-from bind_node import BindNodeData, Keybind, Command
-from text_rendering import TextRendererConfig
+from typing import Any, Optional
+
+from bind_node import BindNodeData, Command, GeneratorData, IncludeData, Keybind
+from configs import (
+    ActionHandlerConfig,
+    DrawingConfig,
+    KeyHandlerConfig,
+    OutputConfig,
+    TextRendererConfig,
+    VisualsHandlerConfig,
+    XOrgConfig
+)
 
 class ConfigManager:
     def __init__(self, config_file_path: Path):
         self.__config_path = config_file_path
 
         self.__pybinds_config = self.__parse_json(config_file_path)
-        bindings_file = self.__find_bindings_file()
-        self.__bindings_dict = self.__parse_json(bindings_file)
-        self.__font_path, self.__font_size = self.__get_font_info()
+        # The bindings file is only parsed by bindnode(), so that it can overlap with the rest of startup
+        self.__bindings_file = self.__find_bindings_file()
+
+        # Looking the font up runs fc-list, so it is left for whoever first needs a renderer
+        self.__font_info: Optional[tuple[Path, int]] = None
 
         self.__background_color = self.__pybinds_config.get("color", {}).get("background", "#5533ff")
 
+        # Included bindings files by path, along with the modification time they were parsed at
+        self.__includes: dict[Path, tuple[int, list[BindNodeData]]] = {}
+        self.__includes_lock = threading.Lock()
+
     @staticmethod
     def __parse_json(path: Path) -> dict[str, Any]:
         with open(path, 'r') as f:
@@ -47,7 +59,37 @@ class ConfigManager:
 
         return path
 
-    def __get_bindnode_data_internal(self, bindings_dict) -> BindNodeData:
+    @staticmethod
+    def __check_bindings_shape(bindings_dict: Any) -> None:
+        """
+        Raises ValueError unless bindings_dict looks like a binding, so that a malformed included
+        file is reported like any other invalid one instead of failing somewhere down the line.
+        """
+        if not isinstance(bindings_dict, dict):
+            raise ValueError(f"Expected a binding object, got {bindings_dict!r}")
+
+        if not isinstance(bindings_dict.get("name"), str):
+            raise ValueError(f"Binding without a valid name: {bindings_dict!r}")
+
+        if not isinstance(bindings_dict.get("key"), (str, int)):
+            raise ValueError(f"Binding {bindings_dict['name']} has no valid key")
+
+        if not isinstance(bindings_dict.get("group", []), list):
+            raise ValueError(f"The group of binding {bindings_dict['name']} should be a list")
+
+        for field in ["command", "generator", "child_command", "include", "generator_keys"]:
+            if not isinstance(bindings_dict.get(field, ""), str):
+                raise ValueError(f"The {field} of binding {bindings_dict['name']} should be a string")
+
+        for field in ["ttl_in_seconds", "timeout_in_seconds"]:
+            value = bindings_dict.get(field, 0)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"The {field} of binding {bindings_dict['name']} should be a number")
+
+    def __get_bindnode_data_internal(self, bindings_dict, base_dir: Path) -> BindNodeData:
+        """base_dir is the directory of the bindings file, against which includes are resolved"""
+        self.__check_bindings_shape(bindings_dict)
+
         command_data = bindings_dict.get("command")
         children_data = bindings_dict.get("group", [])
 
@@ -58,24 +100,91 @@ class ConfigManager:
         command = None
         if command_data:
             keep_running = bool(bindings_dict.get("keep_running", False))
-            command = Command(command_data, keep_running)
+            show_output = bool(bindings_dict.get("show_output", False))
+            command = Command(command_data, keep_running, show_output)
 
         children = list(
             map(
-                lambda data: self.__get_bindnode_data_internal(data),
+                lambda data: self.__get_bindnode_data_internal(data, base_dir),
                 children_data
             )
         )
 
+        generator = None
+        if (generator_command := bindings_dict.get("generator")):
+            generator = self.__generator(generator_command, bindings_dict)
+
+        include = None
+        if (include_path := bindings_dict.get("include")):
+            if generator is not None:
+                raise ValueError(f"Group {name} can't have both a generator and an include")
+
+            include = self.__include(include_path, base_dir)
+
         return BindNodeData(
             name = name,
             key = key,
             command = command,
-            children = children
+            children = children,
+            generator = generator,
+            include = include
+        )
+
+    def __include(self, include_path: str, base_dir: Path) -> IncludeData:
+        path = Path(include_path).expanduser()
+
+        if not path.is_absolute():
+            path = base_dir.joinpath(path)
+
+        # Files reached through different relative paths, e.g. when they include each other, are the same file
+        return IncludeData(path = path.resolve(), load = self.__load_include)
+
+    def __load_include(self, path: Path) -> tuple[int, list[BindNodeData]]:
+        """Children of the root group of an included file, parsed again only if it has been modified"""
+        mtime = path.stat().st_mtime_ns
+
+        # Displays may enter the same group from different threads during startup
+        with self.__includes_lock:
+            cached = self.__includes.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached
+
+            bindings_dict = self.__parse_json(path)
+            if not isinstance(bindings_dict, dict) or not isinstance(bindings_dict.get("group", []), list):
+                raise ValueError(f"Expected a binding object with a group list in {path}")
+
+            children = list(
+                map(
+                    lambda data: self.__get_bindnode_data_internal(data, path.parent),
+                    bindings_dict.get("group", [])
+                )
+            )
+
+            self.__includes[path] = (mtime, children)
+
+        return mtime, children
+
+    def __generator(self, command: str, bindings_dict: dict[str, Any]) -> GeneratorData:
+        keys = bindings_dict.get("generator_keys", "1234567890abcdefghijklmnopqrstuvwxyz")
+
+        # Back and exit keys are resolved before children, so children bound to them are unreachable
+        key_config = self.__key_handler()
+        action_keys = set(key_config.back_keys + key_config.exit_keys)
+        keys = "".join(filter(lambda k: Keybind(k) not in action_keys, keys))
+
+        return GeneratorData(
+            command = command,
+            shell = self.__pybinds_config.get("shell", "/bin/sh"),
+            child_command = bindings_dict.get("child_command"),
+            keep_running = bool(bindings_dict.get("keep_running", False)),
+            ttl_in_seconds = float(bindings_dict.get("ttl_in_seconds", 60)),
+            timeout_in_seconds = float(bindings_dict.get("timeout_in_seconds", 10)),
+            keys = keys
         )
 
     def bindnode(self) -> BindNodeData:
-        return self.__get_bindnode_data_internal(self.__bindings_dict)
+        bindings_dict = self.__parse_json(self.__bindings_file)
+        return self.__get_bindnode_data_internal(bindings_dict, self.__bindings_file.parent)
 
     @staticmethod
     def __str_to_rgb(color: str) -> tuple[int, int, int]:
@@ -115,7 +224,7 @@ class ConfigManager:
             skip_in_pixels=skip
         )
 
-    def __get_font_info(self):
+    def __get_font_info(self) -> tuple[Path, int]:
         font = self.__pybinds_config.get("font", {})
         name: str = font.get("name", "UbuntuMono")
         style: str = font.get("style", "Bold")
@@ -132,6 +241,9 @@ class ConfigManager:
         )
         pattern = f"{name_pattern}.*{style.capitalize()}"
 
+        # Only needed here, and costly enough to keep out of the import path
+        import subprocess
+
         p1 = subprocess.run(["fc-list"], capture_output=True, text=True, check=True)
         output = str(subprocess.run(["grep", pattern], input=p1.stdout, capture_output=True, text=True).stdout)
         first = output.split(":", 1)
@@ -144,10 +256,14 @@ class ConfigManager:
         return font_path, font_size
 
     def __text_renderer(self, name: str, default: str) -> TextRendererConfig:
+        if self.__font_info is None:
+            self.__font_info = self.__get_font_info()
+
+        font_path, font_size = self.__font_info
         color = self.__pybinds_config.get("color", {}).get(name, default)
         return TextRendererConfig(
-            font_path=self.__font_path,
-            font_size=self.__font_size,
+            font_path=font_path,
+            font_size=font_size,
             background_color=self.__background_color,
             foreground_color=color
         )
@@ -180,12 +296,27 @@ class ConfigManager:
 
         return KeyHandlerConfig(back_keys = back_keys, exit_keys=exit_keys)
 
+    def __output(self) -> OutputConfig:
+        output = self.__pybinds_config.get("output", {})
+
+        max_line_length = int(output.get("max_line_length", 120))
+        max_redraws_per_second = float(output.get("max_redraws_per_second", 10))
+
+        if max_line_length < 1 or max_redraws_per_second <= 0:
+            raise ValueError("output.max_line_length and output.max_redraws_per_second must be positive")
+
+        return OutputConfig(
+            max_line_length = max_line_length,
+            max_redraws_per_second = max_redraws_per_second
+        )
+
     def action_handler(self) -> ActionHandlerConfig:
         shell = self.__pybinds_config.get("shell", "/bin/sh")
 
         return ActionHandlerConfig(
             visuals_config = self.__visuals_handler(),
             key_config = self.__key_handler(),
+            output_config = self.__output(),
             shell = shell
         )
 
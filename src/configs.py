@@ -0,0 +1,61 @@
+# This file is part of pybinds.
+# 
+# pybinds is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# 
+# pybinds is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with pybinds. If not, see <https://www.gnu.org/licenses/>. 
+
+"""
+Configuration dataclasses for every component.
+
+They live apart from the components themselves so that reading and validating the configuration
+never imports PIL or opens an X connection.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+
+from bind_node import Keybind
+
+@dataclass
+class XOrgConfig:
+    bar_height: int
+    border_size: int
+    background_color: tuple[int, int, int]
+    border_color: tuple[int, int, int]
+
+@dataclass
+class DrawingConfig:
+    initial_padding_in_pixels: int
+    padding_in_pixels: int
+    skip_in_pixels: int
+
+@dataclass
+class TextRendererConfig:
+    font_path: Path
+    font_size: int
+    background_color: str
+    foreground_color: str
+
+@dataclass
+class VisualsHandlerConfig:
+    separator: str
+    drawing_config: DrawingConfig
+
+@dataclass
+class KeyHandlerConfig:
+    back_keys: list[Keybind]
+    exit_keys: list[Keybind]
+
+@dataclass
+class OutputConfig:
+    max_line_length: int
+    max_redraws_per_second: float
+
+@dataclass
+class ActionHandlerConfig:
+    visuals_config: VisualsHandlerConfig
+    key_config: KeyHandlerConfig
+    output_config: OutputConfig
+    shell: str
@@ -6,29 +6,52 @@
 # 
 # You should have received a copy of the GNU General Public License along with pybinds. If not, see <https://www.gnu.org/licenses/>. 
 
-from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
 
-from PIL.Image import Image
 from Xlib import display
-from Xlib.X import CurrentTime, ExposureMask, GrabModeAsync, GrabModeSync, KeyPressMask, KeyReleaseMask, RevertToParent
+from Xlib.X import CurrentTime, ExposureMask, GrabModeAsync, GrabModeSync, KeyPressMask, KeyReleaseMask, RevertToParent, TrueColor
 
 from itertools import accumulate, chain, cycle, repeat
 
-from Xlib.protocol.rq import Event
+from Xlib.protocol.rq import DictWrapper, Event
 
 from bind_node import Keybind
+from configs import DrawingConfig, XOrgConfig
 
-@dataclass
-class XOrgConfig:
-    bar_height: int
-    border_size: int
-    background_color: tuple[int, int, int]
-    border_color: tuple[int, int, int]
+if TYPE_CHECKING:
+    from PIL.Image import Image
 
+class _CoreDisplay(display.Display):
+    """
+    An Xlib Display that skips extension discovery and defers fetching the keyboard mapping.
+
+    Xlib.display.Display waits for a reply to ListExtensions, one QueryExtension per extension it
+    knows of, and GetKeyboardMapping before returning. pybinds uses no extensions, and fetching the
+    mapping through load_keymap() once the rest of the setup has been queued lets everything go
+    out in a single round trip. Relies on Xlib internals, which have been stable for ages.
+    """
+    def __init__(self, display_name: Optional[str] = None):
+        self.display = display._BaseDisplay(display_name)
+
+        self._keymap_codes = [()] * 256
+        self._keymap_syms = {}
+        self.keysym_translations = {}
+
+        self.extensions = []
+        self.class_extension_dicts = {}
+        self.display_extension_methods = {}
+        self.extension_event = DictWrapper({})
+
+    def load_keymap(self):
+        info = self.display.info
+        self._update_keymap(info.min_keycode, info.max_keycode - info.min_keycode + 1)
 
 class XOrgHandler():
-    def __init__(self, config: XOrgConfig):
-        self.__display = display.Display()
+    def __init__(self, config: XOrgConfig, display_name: Optional[str] = None):
+        """display_name is an X display string such as ":1"; None means $DISPLAY"""
+        self.__display = _CoreDisplay(display_name)
+
+        # All of this comes with the connection setup, so there's no need to ask the server
         self.__screen = self.__display.screen()
         self.__root_window = self.__screen.root
         self.__width_in_pixels = self.__screen.width_in_pixels
@@ -36,9 +59,9 @@ class XOrgHandler():
         self.__border_size = config.border_size
 
         self.__colormap = self.__screen.default_colormap
-        
-        background_color = self.__colormap.alloc_color(*config.background_color)
-        border_color = self.__colormap.alloc_color(*config.border_color)
+
+        background_pixel = self.__color_to_pixel(config.background_color)
+        border_pixel = self.__color_to_pixel(config.border_color)
 
         self.bar = self.__root_window.create_window(
                     x = 0,
@@ -47,7 +70,7 @@ class XOrgHandler():
                     height = self.__height_in_pixels,
                     depth = self.__screen.root_depth,
                     border_width = 0,
-                    background_pixel = background_color.pixel,
+                    background_pixel = background_pixel,
                     border_pixel = self.__screen.white_pixel,
                     event_mask = (ExposureMask | KeyPressMask | KeyReleaseMask),
                     override_redirect = 1 # dgaf about the window manager
@@ -61,7 +84,7 @@ class XOrgHandler():
                     height = self.__border_size,
                     depth = self.__screen.root_depth,
                     border_width = 0,
-                    background_pixel = border_color.pixel,
+                    background_pixel = border_pixel,
                     border_pixel = self.__screen.white_pixel,
                     event_mask = (ExposureMask),
                     override_redirect = 1 # dgaf about the window manager
@@ -69,12 +92,39 @@ class XOrgHandler():
 
             self.border.map()
 
-        # Really don't care about this. It's just necessary for the graphics context
-        font = self.__display.open_font("fixed") 
-        self.gc = self.bar.create_gc(font = font, foreground = self.__screen.white_pixel)
+        # Images are all that is drawn, so the graphics context needs no font
+        self.gc = self.bar.create_gc(foreground = self.__screen.white_pixel)
 
         self.bar.map()
         self.bar.set_input_focus(RevertToParent, CurrentTime)
+
+        # None of the above waits for a reply, so it's all sent along with this one request
+        self.__display.load_keymap()
+
+    def __root_visual(self):
+        for depth in self.__screen.allowed_depths:
+            for visual in depth.visuals:
+                if visual.visual_id == self.__screen.root_visual:
+                    return visual
+
+        return None
+
+    def __color_to_pixel(self, color: tuple[int, int, int]) -> int:
+        """
+        On TrueColor visuals (i.e. nearly always) pixel values are just the color bits placed
+        according to the visual's masks, so they are computed here instead of asking the server.
+        """
+        visual = self.__root_visual()
+        if visual is None or visual.visual_class != TrueColor:
+            return self.__colormap.alloc_color(*color).pixel
+
+        pixel = 0
+        for value, mask in zip(color, (visual.red_mask, visual.green_mask, visual.blue_mask)):
+            shift = (mask & -mask).bit_length() - 1
+            bits = (mask >> shift).bit_length()
+            pixel |= ((value >> (16 - bits)) << shift) & mask
+
+        return pixel
     
     def get_dimensions_in_pixels(self) -> tuple[int, int]:
         """Returns (width, height)"""
@@ -83,6 +133,19 @@ class XOrgHandler():
     def next_event(self) -> Event:
         return self.__display.next_event()
 
+    def pending_events(self) -> int:
+        return self.__display.pending_events()
+
+    def fileno(self) -> int:
+        """File descriptor of the X connection, so that several displays can be select()ed on"""
+        return self.__display.fileno()
+
+    def get_display_name(self) -> str:
+        return self.__display.get_display_name()
+
+    def close(self):
+        self.__display.close()
+
     def flush(self):
         self.__display.flush()
 
@@ -92,14 +155,22 @@ class XOrgHandler():
     def keysym_to_keycode(self, keysym: int) -> int:
         return self.__display.keysym_to_keycode(keysym)
 
+    def refresh_keyboard_mapping(self, event: Event):
+        """Keeps the cached keyboard mapping in sync when the server reports a MappingNotify"""
+        self.__display.refresh_keyboard_mapping(event)
+
     def keysym_to_keybind(self, keysym: int) -> Keybind:
         return Keybind(self.__display.keysym_translations[keysym])
 
     def request_redraw(self):
+        self.clear(0, self.__width_in_pixels)
+
+    def clear(self, x: int, width: int):
+        """Clears a full-height strip of the bar"""
         self.bar.clear_area(
-            x = 0,
+            x = x,
             y = 0,
-            width = self.__width_in_pixels,
+            width = width,
             height = self.__height_in_pixels
         )
 
@@ -111,19 +182,13 @@ class XOrgHandler():
             time = CurrentTime
         )
 
-@dataclass
-class DrawingConfig:
-    initial_padding_in_pixels: int
-    padding_in_pixels: int
-    skip_in_pixels: int
-
 class DrawManager():
     def __init__(
             self,
             xorg_handler: XOrgHandler,
-            separator_image: Image,
-            key_images: list[Image],
-            text_images: list[Image],
+            separator_image: "Image",
+            key_images: list["Image"],
+            text_images: list["Image"],
             config: DrawingConfig
             ):
         self.__bar = xorg_handler.bar
@@ -150,7 +215,7 @@ class DrawManager():
         if self.__y_position < 0:
             print("WARNING: Bar height is smaller than text height. Decrease font size or increase bar size.")
 
-        if self.__max_width < self.__x_positions[-1] + self.__images[-1].size[0]:
+        if self.__images and self.__max_width < self.__x_positions[-1] + self.__images[-1].size[0]:
             print("WARNING: Keybinds too long to fit on screen. Decrease font size or paddings. Or get a bigger screen, lol.")
 
     def draw(self):
@@ -165,6 +230,13 @@ class DrawManager():
     def get_positions(self):
         return list(zip(self.__x_positions, repeat(self.__y_position)))
 
+    def get_right_end(self) -> int:
+        """x position right after the last image"""
+        if not self.__images:
+            return 0
+
+        return self.__x_positions[-1] + self.__images[-1].size[0]
+
 if __name__ == "__main__":
     config = XOrgConfig(20, 1, (255*256, 0, 16*256), (0, 255*256, 0))
 
@@ -0,0 +1,222 @@
+# This file is part of pybinds.
+# 
+# pybinds is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# 
+# pybinds is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with pybinds. If not, see <https://www.gnu.org/licenses/>. 
+
+"""
+Checks the import cost of every pybinds mode against the budgets recorded in import_budget.json.
+
+Each mode is measured by running main.py itself under `python -X importtime`, against a stub
+configuration, font and fc-list, counting only the modules that a bare interpreter does not already
+load. Modes that need X are pointed at a display that doesn't exist, so they stop right after their
+imports.
+
+Wall-clock times vary a lot between machines and runs, so each cost is recorded as a multiple of
+the import time of a bare interpreter, measured alongside it, and budgets get generous headroom.
+The hard gates are the module sets: exits with status 1 if any mode imports a module it must not,
+fails before reaching the modules it requires or ends differently than expected, or goes over
+budget. Run with --record to store the current costs (plus headroom) as the new budgets.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+SRC_DIR = Path(__file__).resolve().parent
+MAIN = SRC_DIR.joinpath("main.py")
+BUDGET_FILE = SRC_DIR.joinpath("import_budget.json")
+
+# Only the unix socket is tried for unix/ displays, and nothing listens on this one, so connecting
+# fails right away and the mode goes through its usual handling of an unreachable display
+UNREACHABLE_DISPLAY = "unix/:65000"
+
+STUB_CONFIG = {"bindings_file": "bindings.json", "font": {"name": "Stub", "style": "Regular"}}
+STUB_BINDINGS = {"name": "root", "key": "", "group": [{"name": "Stub", "key": "s", "command": "true"}]}
+STUB_FONT = "Stub-Regular.ttf"
+STUB_FC_LIST = "#!/bin/sh\necho '{font}: Stub:style=Regular'\n"
+
+@dataclass
+class EntryPoint:
+    args: list[str]
+    # Modules the mode must get to, so that a run failing early can't pass as a cheap one
+    required: list[str]
+    forbidden: list[str]
+    must_succeed: bool
+    # Printed when the mode ends the expected way, so that it can't end on an unrelated error
+    expected_message: Optional[str] = None
+
+ENTRY_POINTS = {
+    "validate": EntryPoint(
+        args = ["--validate"],
+        required = ["config_handler", "bind_node"],
+        forbidden = ["PIL", "Xlib.display", "action_handler", "draw_bar", "text_rendering", "startup"],
+        must_succeed = True
+    ),
+    # Reports everything but X
+    "memory-report": EntryPoint(
+        args = ["--memory-report", "-d", UNREACHABLE_DISPLAY],
+        required = ["memory_report", "action_handler", "text_rendering", "PIL.ImageFont"],
+        forbidden = ["startup"],
+        must_succeed = True,
+        expected_message = "skipping X accounting"
+    ),
+    "run": EntryPoint(
+        args = ["-d", UNREACHABLE_DISPLAY],
+        required = ["action_handler", "startup", "draw_bar", "text_rendering"],
+        forbidden = ["memory_report"],
+        must_succeed = False,
+        expected_message = "Unable to open any display"
+    ),
+}
+
+def write_stubs(directory: Path) -> None:
+    with open(directory.joinpath("config.json"), 'w') as f:
+        json.dump(STUB_CONFIG, f)
+
+    with open(directory.joinpath("bindings.json"), 'w') as f:
+        json.dump(STUB_BINDINGS, f)
+
+    # Pillow's own default font, so that font loading goes through the same path as a real one
+    from PIL import ImageFont
+
+    font = directory.joinpath(STUB_FONT)
+    font.write_bytes(ImageFont.load_default().font_bytes)
+
+    fc_list = directory.joinpath("fc-list")
+    fc_list.write_text(STUB_FC_LIST.format(font=font))
+    fc_list.chmod(0o755)
+
+def measure(args: list[str], stub_dir: Path, must_succeed: bool, expected_message: Optional[str] = None) -> dict[str, int]:
+    """Self import time in microseconds of every module imported, by module name"""
+    command = [sys.executable, "-X", "importtime"]
+    if args:
+        command += [str(MAIN), "-c", str(stub_dir.joinpath("config.json"))] + args
+    else:
+        command += ["-c", "pass"]
+
+    process = subprocess.run(
+        command,
+        capture_output=True,
+        text=True,
+        cwd=stub_dir,
+        env={**os.environ, "PATH": f"{stub_dir}{os.pathsep}{os.environ.get('PATH', '')}"}
+    )
+
+    if must_succeed and process.returncode != 0:
+        errors = "\n".join(line for line in process.stderr.splitlines() if not line.startswith("import time:"))
+        raise RuntimeError(f"{' '.join(args)} failed:\n{errors}")
+
+    if expected_message is not None and expected_message not in process.stderr + process.stdout:
+        errors = "\n".join(line for line in process.stderr.splitlines() if not line.startswith("import time:"))
+        raise RuntimeError(f"{' '.join(args)} didn't print \"{expected_message}\":\n{errors}")
+
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        self_time, _, name = line.removeprefix("import time:").split("|")
+        if self_time.strip().isdigit():
+            times[name.strip()] = int(self_time)
+
+    return times
+
+def entry_point_cost(entry_point: EntryPoint, stub_dir: Path, repeats: int) -> tuple[float, set[str]]:
+    """
+    Returns the import time of the mode as a multiple of that of a bare interpreter, and the modules
+    imported. Both are measured back to back in every run, and the fastest run of each counts.
+    """
+    baseline = set(measure([], stub_dir, True))
+
+    best_cost = None
+    best_baseline_cost = None
+    imported: set[str] = set()
+    for _ in range(repeats):
+        baseline_cost = sum(measure([], stub_dir, True).values())
+        times = {
+            name: t for name, t in measure(
+                entry_point.args, stub_dir, entry_point.must_succeed, entry_point.expected_message
+            ).items()
+            if name not in baseline
+        }
+        cost = sum(times.values())
+        imported = set(times)
+
+        if best_cost is None or cost < best_cost:
+            best_cost = cost
+        if best_baseline_cost is None or baseline_cost < best_baseline_cost:
+            best_baseline_cost = baseline_cost
+
+    return (best_cost or 0) / max(best_baseline_cost or 1, 1), imported
+
+def is_forbidden(module: str, forbidden: list[str]) -> bool:
+    return any(module == f or module.startswith(f + ".") for f in forbidden)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check pybinds import cost against the recorded budget")
+    parser.add_argument("--record", help="Store the current costs as the new budgets", action="store_true")
+    parser.add_argument("--repeats", help="Runs per mode; the fastest one counts. Default: 5", type=int, default=5)
+    parser.add_argument("--headroom", help="Budget as a multiple of the cost when recording. Default: 2.5", type=float, default=2.5)
+    args = parser.parse_args()
+
+    budgets: dict[str, float] = {}
+    if BUDGET_FILE.exists():
+        with open(BUDGET_FILE, 'r') as f:
+            budgets = json.load(f)
+
+    with tempfile.TemporaryDirectory(prefix="pybinds-import-budget-") as directory:
+        stub_dir = Path(directory)
+        write_stubs(stub_dir)
+
+        failed = check_entry_points(budgets, stub_dir, args)
+
+    if args.record:
+        with open(BUDGET_FILE, 'w') as f:
+            json.dump(budgets, f, indent=2)
+            f.write("\n")
+
+    return 1 if failed else 0
+
+def check_entry_points(budgets: dict[str, float], stub_dir: Path, args: argparse.Namespace) -> bool:
+    """Returns whether any mode failed. Updates budgets in place when recording"""
+    failed = False
+    for name, entry_point in ENTRY_POINTS.items():
+        cost, imported = entry_point_cost(entry_point, stub_dir, args.repeats)
+        budget = budgets.get(name)
+
+        missing = sorted(filter(lambda m: m not in imported, entry_point.required))
+        if missing:
+            print(f"FAIL {name}: never got to import {', '.join(missing)}")
+            failed = True
+
+        forbidden = sorted(filter(lambda m: is_forbidden(m, entry_point.forbidden), imported))
+        if forbidden:
+            print(f"FAIL {name}: imports {', '.join(forbidden)}")
+            failed = True
+
+        if args.record:
+            budgets[name] = round(cost * args.headroom, 1)
+            print(f"{name}: {cost:.1f}x bare interpreter, budget set to {budgets[name]}x")
+        elif budget is None:
+            print(f"FAIL {name}: {cost:.1f}x bare interpreter, no budget recorded")
+            failed = True
+        elif cost > budget:
+            print(f"FAIL {name}: {cost:.1f}x bare interpreter, over the budget of {budget}x")
+            failed = True
+        else:
+            print(f"ok   {name}: {cost:.1f}x bare interpreter, budget {budget}x")
+
+    return failed
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,16 +8,30 @@
 
 import argparse
 import os
+import sys
 
+from dataclasses import dataclass
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
-from action_handler import ActionHandler
-from bind_node import BindNode
+from bind_node import BindNode, load_all_includes
 from config_handler import ConfigManager
-from draw_bar import XOrgHandler
-from text_rendering import TextRenderer
 
-def parse_cli_args() -> Path:
+# Anything that pulls in PIL, Xlib.display or the startup thread pool is imported by the mode that needs it
+if TYPE_CHECKING:
+    from draw_bar import XOrgHandler
+    from startup import StartupPipeline
+    from text_rendering import TextRenderer
+
+@dataclass
+class CliArgs:
+    config_path: Path
+    displays: list[Optional[str]]
+    timings: bool
+    validate: bool
+    memory_report: bool
+
+def parse_cli_args() -> CliArgs:
     parser = argparse.ArgumentParser()
 
     xdg_config_home = str(os.getenv("XDG_CONFIG_HOME"))
@@ -28,12 +42,46 @@ def parse_cli_args() -> Path:
             help=f"Path to configuration file. Default: $XDG_CONFIG_HOME/{config_path}",
             default=f"{xdg_config_home}/{config_path}"
         )
+    parser.add_argument(
+            "-d",
+            "--display",
+            help="X display to show the bar on, such as :1. May be given several times to serve many displays from one process. Default: $DISPLAY",
+            action="append",
+            dest="displays"
+        )
+    parser.add_argument(
+            "--timings",
+            help="Print how long each startup stage took",
+            action="store_true"
+        )
+
+    parser.add_argument(
+            "--validate",
+            help="Check the configuration and bindings files and exit without opening any display",
+            action="store_true"
+        )
+
+    parser.add_argument(
+            "--memory-report",
+            help="Print how much memory each part of pybinds uses with the given configuration and exit",
+            action="store_true"
+        )
 
     args = parser.parse_args()
 
-    return Path(args.config)
+    displays = args.displays if args.displays else [None]
+
+    return CliArgs(
+        config_path = Path(args.config),
+        displays = displays,
+        timings = args.timings,
+        validate = args.validate,
+        memory_report = args.memory_report
+    )
+
+def initialize_renderers(config_handler: ConfigManager) -> dict[str, "TextRenderer"]:
+    from text_rendering import TextRenderer
 
-def initialize_renderers(config_handler: ConfigManager):
     seprend = TextRenderer(config_handler.separator_renderer())
     keyrend = TextRenderer(config_handler.key_renderer())
     texrend = TextRenderer(config_handler.text_renderer())
@@ -44,25 +92,96 @@ def initialize_renderers(config_handler: ConfigManager):
         "texts": texrend
     }
 
-if __name__ == "__main__":
+def connect(ch: ConfigManager, display_name: Optional[str]) -> Optional["XOrgHandler"]:
+    """Sets the bar up on display_name, or returns None if it can't be reached"""
+    from Xlib.error import ConnectionClosedError, DisplayError
+    from draw_bar import XOrgHandler
+
+    try:
+        return XOrgHandler(ch.xorg(), display_name)
+    except (ConnectionClosedError, DisplayError) as e:
+        print(f"WARNING: Skipping display {display_name or '$DISPLAY'}: {e}")
+        return None
+
+def build_startup_pipeline(config_path: Path, displays: list[Optional[str]]) -> "StartupPipeline":
+    """
+    Fonts, bindings and the X connections only depend on the configuration file, so they are set up
+    concurrently. Each display's ActionHandler renders the root node as soon as all three are ready.
+    Displays that can't be reached end up with None as their ActionHandler.
+    """
+    from action_handler import ActionHandler
+    from startup import StartupPipeline
+
+    pipeline = StartupPipeline()
+
+    pipeline.add_stage("config", lambda: ConfigManager(config_path))
+    pipeline.add_stage("renderers", initialize_renderers, ["config"])
+    pipeline.add_stage("bindings", lambda ch: BindNode(ch.bindnode()), ["config"])
+
+    for display_name in displays:
+        pipeline.add_stage(
+            f"xorg:{display_name}",
+            lambda ch, display_name=display_name: connect(ch, display_name),
+            ["config"]
+        )
+
+    # The bindings tree and renderers (with their caches) are shared by every display
+    for display_name in displays:
+        pipeline.add_stage(
+            f"actions:{display_name}",
+            lambda ch, renderers, root, xorg_handler: None if xorg_handler is None else ActionHandler(
+                root = root,
+                renderers = renderers,
+                xorg_handler = xorg_handler,
+                config = ch.action_handler()
+            ),
+            ["config", "renderers", "bindings", f"xorg:{display_name}"]
+        )
 
-    config_path = parse_cli_args()
+    return pipeline
 
+def validate(config_path: Path) -> None:
+    """Builds every configuration object, which raises on the first invalid value"""
     ch = ConfigManager(config_path)
 
-    renderers = initialize_renderers(ch)
+    ch.xorg()
+    ch.action_handler()
+    ch.separator_renderer()
+    load_all_includes(BindNode(ch.bindnode()))
 
-    xorg_handler = XOrgHandler(ch.xorg())
+    print(f"{config_path}: OK")
 
-    root = BindNode(ch.bindnode())
+def run(args: CliArgs) -> None:
+    from action_handler import ActionHandlerPool
 
-    action_handler = ActionHandler(
-        root = root,
-        renderers = renderers,
-        xorg_handler = xorg_handler,
-        config = ch.action_handler()
-    )
+    pipeline = build_startup_pipeline(args.config_path, args.displays)
+    stages = pipeline.run()
+
+    if args.timings:
+        print(pipeline.report())
+
+    action_handlers = [
+        handler for display_name in args.displays
+        if (handler := stages[f"actions:{display_name}"]) is not None
+    ]
+
+    if not action_handlers:
+        sys.exit("Unable to open any display")
+
+    pool = ActionHandlerPool(action_handlers)
+
+    pool.grab_keyboard()
+
+    pool.loop()
+
+if __name__ == "__main__":
 
-    action_handler.grab_keyboard()
+    args = parse_cli_args()
 
-    action_handler.loop()
+    if args.validate:
+        validate(args.config_path)
+    elif args.memory_report:
+        from memory_report import MemoryReport
+        print(MemoryReport(args.config_path, args.displays[0]).run())
+    else:
+        run(args)
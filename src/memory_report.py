@@ -0,0 +1,278 @@
+# This file is part of pybinds.
+# 
+# pybinds is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# 
+# pybinds is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with pybinds. If not, see <https://www.gnu.org/licenses/>. 
+
+"""
+Memory accounting for pybinds.
+
+Startup is replayed one subsystem at a time with tracemalloc snapshots in between, so that the
+Python memory retained by each step can be attributed to it. tracemalloc only sees allocations
+made through Python's allocators: pixel buffers of rendered images and FreeType font data live in
+native memory, so images are accounted for from their dimensions instead.
+"""
+
+import gc
+import sys
+import tracemalloc
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from bind_node import BindNode, Command, Keybind, load_all_includes
+from config_handler import ConfigManager
+
+@dataclass
+class PhaseUsage:
+    name: str
+    size_in_bytes: int
+    blocks: int
+
+@dataclass
+class SubtreeUsage:
+    path: str
+    nodes: int
+    size_in_bytes: int
+
+def deep_sizeof(obj: Any, seen: set[int]) -> int:
+    """Size of obj and everything reachable from it that is not already in seen"""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += deep_sizeof(vars(obj), seen)
+
+    return size
+
+def subtree_sizeof(node: BindNode) -> int:
+    # Stop at the parent, otherwise every subtree would include the whole tree
+    return deep_sizeof(node, {id(node.get_parent())})
+
+def iterate_nodes(node: BindNode, path: str = "") -> Iterator[tuple[str, BindNode]]:
+    path = f"{path}/{node.get_key()}" if path else str(node.get_key()) or "root"
+    yield path, node
+
+    for child in node.get_all_children():
+        yield from iterate_nodes(child, path)
+
+def iterate_file_nodes(node: BindNode) -> Iterator[BindNode]:
+    """Descendants of node read from the same file, i.e. leaving out the children of nested includes"""
+    for child in node.get_all_children():
+        yield child
+
+        if child.get_include_path() is None:
+            yield from iterate_file_nodes(child)
+
+def file_sizeof(node: BindNode) -> int:
+    """Size of the subtree of node, leaving out the children of nested includes"""
+    seen = {id(node.get_parent())}
+    for descendant in iterate_file_nodes(node):
+        if descendant.get_include_path() is not None:
+            seen.update(id(child) for child in descendant.get_all_children())
+
+    return deep_sizeof(node, seen)
+
+def count_nodes(node: BindNode) -> int:
+    return sum(1 for _ in iterate_nodes(node))
+
+def format_size(size_in_bytes: float) -> str:
+    for unit in ["B", "KiB", "MiB"]:
+        if abs(size_in_bytes) < 1024:
+            return f"{size_in_bytes:.1f} {unit}"
+        size_in_bytes /= 1024
+
+    return f"{size_in_bytes:.1f} GiB"
+
+class MemoryReport:
+    def __init__(self, config_path: Path, display_name: Optional[str] = None, top_subtrees: int = 10):
+        self.__config_path = config_path
+        self.__display_name = display_name
+        self.__top_subtrees = top_subtrees
+
+        self.__phases: list[PhaseUsage] = []
+        self.__snapshot: tracemalloc.Snapshot
+
+        # Whatever the phases create is kept alive here, so that later snapshots still see it
+        self.__objects: dict[str, Any] = {}
+
+    @staticmethod
+    def __take_snapshot() -> tracemalloc.Snapshot:
+        # Cyclic garbage from a phase would otherwise be freed, and subtracted, during a later one
+        gc.collect()
+
+        return tracemalloc.take_snapshot()
+
+    def __phase(self, name: str) -> None:
+        """Attributes everything allocated since the previous phase to name"""
+        snapshot = self.__take_snapshot()
+
+        # Snapshots are themselves traced, and would otherwise show up in the next phase. Filtering
+        # the per-file differences is much cheaper than filtering every trace of every snapshot
+        ignored = {tracemalloc.__file__, __file__}
+        stats = [
+            stat for stat in snapshot.compare_to(self.__snapshot, "filename")
+            if stat.traceback[0].filename not in ignored
+        ]
+
+        self.__phases.append(PhaseUsage(
+            name = name,
+            size_in_bytes = sum(stat.size_diff for stat in stats),
+            blocks = sum(stat.count_diff for stat in stats)
+        ))
+
+        self.__snapshot = snapshot
+
+    def __measure(self) -> None:
+        tracemalloc.start()
+        self.__snapshot = self.__take_snapshot()
+
+        from action_handler import ActionHandler
+        from draw_bar import XOrgHandler
+        from text_rendering import TextRenderer
+        self.__phase("imports")
+
+        # Imported modules stay for good: forgetting their traces keeps every later snapshot, and
+        # comparison, down to what the following phases allocate
+        tracemalloc.clear_traces()
+        self.__snapshot = self.__take_snapshot()
+
+        ch = ConfigManager(self.__config_path)
+        self.__objects["config"] = ch
+        self.__phase("configuration")
+
+        data = ch.bindnode()
+        self.__objects["data"] = data
+        self.__phase("BindNodeData tree (freed after startup)")
+
+        root = BindNode(data)
+        self.__objects["root"] = root
+        self.__phase("BindNode tree")
+
+        # Read on demand otherwise, which a long-lived process eventually does anyway
+        self.__objects["includes"] = load_all_includes(root)
+        self.__phase("included bindings files")
+
+        renderers = {
+            "separator": TextRenderer(ch.separator_renderer()),
+            "keys": TextRenderer(ch.key_renderer()),
+            "texts": TextRenderer(ch.text_renderer())
+        }
+        self.__objects["renderers"] = renderers
+        self.__phase("TextRenderer fonts")
+
+        # Render what visiting every node would, i.e. the renderer caches of a long-lived process
+        separator = ch.action_handler().visuals_config.separator
+        renderers["separator"].render(separator)
+        for _, node in iterate_nodes(root):
+            for child in node.get_all_children():
+                renderers["keys"].render(str(child.get_key()))
+                renderers["texts"].render(child.get_name())
+        self.__phase("rendered images (Python objects)")
+
+        from Xlib.error import DisplayError
+        try:
+            xorg_handler = XOrgHandler(ch.xorg(), self.__display_name)
+        except DisplayError as e:
+            print(f"WARNING: skipping X accounting, unable to open display: {e}")
+            return
+
+        self.__objects["xorg"] = xorg_handler
+        self.__phase("Xlib client state")
+
+        self.__objects["actions"] = ActionHandler(
+            root = root,
+            renderers = renderers,
+            xorg_handler = xorg_handler,
+            config = ch.action_handler()
+        )
+        self.__phase("ActionHandler and root layout")
+
+        xorg_handler.close()
+
+    def __tree_report(self, root: BindNode) -> list[str]:
+        nodes = list(iterate_nodes(root))
+        node_count = len(nodes)
+
+        keys: dict[int, Keybind] = {id(node.get_key()): node.get_key() for _, node in nodes}
+        commands: dict[int, Command] = {
+            id(command): command for _, node in nodes if (command := node.get_command()) is not None
+        }
+
+        tree_size = subtree_sizeof(root)
+        keys_size = deep_sizeof(list(keys.values()), set())
+        commands_size = deep_sizeof(list(commands.values()), set())
+
+        lines = [
+            f"Bindings: {node_count} nodes, {len(commands)} commands",
+            f"  tree total:       {format_size(tree_size):>12}  ({format_size(tree_size / node_count)} per node)",
+            f"  Keybind objects:  {format_size(keys_size):>12}  ({format_size(keys_size / max(len(keys), 1))} each)",
+            f"  Command objects:  {format_size(commands_size):>12}  ({format_size(commands_size / max(len(commands), 1))} each)",
+        ]
+
+        subtrees = [
+            SubtreeUsage(path, count_nodes(node), subtree_sizeof(node))
+            for path, node in nodes if node is not root
+        ]
+        subtrees.sort(key=lambda s: s.size_in_bytes, reverse=True)
+
+        lines.append("Largest subtrees:")
+        for subtree in subtrees[:self.__top_subtrees]:
+            lines.append(f"  {format_size(subtree.size_in_bytes):>12}  {subtree.nodes:6} nodes  {subtree.path}")
+
+        return lines
+
+    def __files_report(self, root: BindNode, includes: dict[Path, BindNode]) -> list[str]:
+        files = [("main bindings file", root)] + [(str(path), node) for path, node in includes.items()]
+        usages = [
+            SubtreeUsage(name, sum(1 for _ in iterate_file_nodes(node)), file_sizeof(node))
+            for name, node in files
+        ]
+        usages.sort(key=lambda s: s.size_in_bytes, reverse=True)
+
+        lines = ["Bindings per file (without the files they include):"]
+        for usage in usages:
+            lines.append(f"  {format_size(usage.size_in_bytes):>12}  {usage.nodes:6} nodes  {usage.path}")
+
+        return lines
+
+    def __images_report(self, renderers: dict[str, Any]) -> list[str]:
+        lines = ["Rendered images (native pixel buffers):"]
+        for name, renderer in renderers.items():
+            images = renderer.get_cached_images()
+            pixels = sum(img.size[0] * img.size[1] * len(img.getbands()) for img in images)
+            lines.append(f"  {name:<12} {len(images):6} images  {format_size(pixels):>12}")
+
+        return lines
+
+    def run(self) -> str:
+        self.__measure()
+        tracemalloc.stop()
+
+        lines = ["Python memory retained per subsystem (tracemalloc):"]
+        for phase in self.__phases:
+            lines.append(f"  {phase.name:<40} {format_size(phase.size_in_bytes):>12}  {phase.blocks:8} blocks")
+
+        total = sum(phase.size_in_bytes for phase in self.__phases)
+        lines.append(f"  {'total':<40} {format_size(total):>12}")
+        lines.append("")
+
+        lines.extend(self.__images_report(self.__objects["renderers"]))
+        lines.append("")
+
+        lines.extend(self.__tree_report(self.__objects["root"]))
+        lines.append("")
+
+        lines.extend(self.__files_report(self.__objects["root"], self.__objects["includes"]))
+
+        return "\n".join(lines)
@@ -0,0 +1,92 @@
+# This file is part of pybinds.
+# 
+# pybinds is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# 
+# pybinds is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along with pybinds. If not, see <https://www.gnu.org/licenses/>. 
+
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+@dataclass
+class StageTiming:
+    start: float
+    end: float
+
+    def duration(self) -> float:
+        return self.end - self.start
+
+class StartupPipeline:
+    """
+    Runs startup stages on a small thread pool, each one as soon as its dependencies are done.
+
+    Stages receive the results of their dependencies as positional arguments, in the order the
+    dependencies were given. A stage may only depend on stages added before it, which keeps
+    the graph acyclic and guarantees that a waiting stage never starves its dependencies.
+    """
+    def __init__(self, max_workers: int = 4) -> None:
+        self.__max_workers = max_workers
+        self.__stages: dict[str, tuple[Callable[..., Any], list[str]]] = {}
+        self.__timings: dict[str, StageTiming] = {}
+        self.__start = 0.0
+        self.__end = 0.0
+
+    def add_stage(self, name: str, function: Callable[..., Any], dependencies: list[str] = []) -> None:
+        if name in self.__stages:
+            raise ValueError(f"Startup stage {name} defined twice")
+
+        for dependency in dependencies:
+            if dependency not in self.__stages:
+                raise ValueError(f"Startup stage {name} depends on unknown stage {dependency}")
+
+        self.__stages[name] = (function, list(dependencies))
+
+    def __run_stage(self, name: str, function: Callable[..., Any], dependencies: list[Future]) -> Any:
+        args = [dependency.result() for dependency in dependencies]
+
+        start = time.perf_counter()
+        result = function(*args)
+        self.__timings[name] = StageTiming(start - self.__start, time.perf_counter() - self.__start)
+
+        return result
+
+    def run(self) -> dict[str, Any]:
+        """Runs every stage and returns their results by name. Re-raises the first failure"""
+        self.__timings = {}
+        self.__start = time.perf_counter()
+
+        futures: dict[str, Future] = {}
+        with ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix="pybinds-startup") as executor:
+            for name, (function, dependencies) in self.__stages.items():
+                futures[name] = executor.submit(
+                    self.__run_stage,
+                    name,
+                    function,
+                    [futures[dependency] for dependency in dependencies]
+                )
+
+            results = {name: future.result() for name, future in futures.items()}
+
+        self.__end = time.perf_counter()
+
+        return results
+
+    def get_timings(self) -> dict[str, StageTiming]:
+        """Start and end of every stage, in seconds since the pipeline started"""
+        return dict(self.__timings)
+
+    def report(self) -> str:
+        lines = [
+            f"{name:<24} {1000*timing.start:8.1f} ms -> {1000*timing.end:8.1f} ms ({1000*timing.duration():7.1f} ms)"
+            for name, timing in sorted(self.__timings.items(), key=lambda item: item[1].start)
+        ]
+
+        total = self.__end - self.__start
+        sequential = sum(map(lambda timing: timing.duration(), self.__timings.values()))
+        lines.append(f"{'total':<24} {1000*total:8.1f} ms (sum of stages: {1000*sequential:.1f} ms)")
+
+        return "\n".join(lines)
@@ -6,27 +6,27 @@
 # 
 # You should have received a copy of the GNU General Public License along with pybinds. If not, see <https://www.gnu.org/licenses/>. 
 
-from dataclasses import dataclass
+from collections import OrderedDict
 from pathlib import Path
 
 from PIL import ImageFont, Image, ImageDraw
 
-Font = ImageFont.ImageFont | ImageFont.FreeTypeFont
+from configs import TextRendererConfig
 
-@dataclass
-class TextRendererConfig:
-    font_path: Path
-    font_size: int
-    background_color: str
-    foreground_color: str
+Font = ImageFont.ImageFont | ImageFont.FreeTypeFont
 
 class TextRenderer:
-    def __init__(self, config: TextRendererConfig):
+    def __init__(self, config: TextRendererConfig, max_cached_images: int = 1024):
         self.__background_color = config.background_color
         self.__foreground_color = config.foreground_color
         self.__font = self.__get_font(config.font_path, config.font_size)
         self.__height_in_pixels = config.font_size
 
+        # Rendered images only depend on the text, so they can be shared by every display.
+        # Least recently used ones are dropped, since command output can be anything
+        self.__cache: OrderedDict[str, Image.Image] = OrderedDict()
+        self.__max_cached_images = max_cached_images
+
     def __get_font(self, font_path: Path, font_size: int) -> Font:
         match font_path.suffix:
             case ".ttf" | ".otf":
@@ -35,6 +35,22 @@ class TextRenderer:
                 return ImageFont.load(font_path.name)
 
     def render(self, text: str) -> Image.Image:
+        image = self.__cache.get(text)
+        if image is None:
+            image = self.__render(text)
+            self.__cache[text] = image
+
+            if len(self.__cache) > self.__max_cached_images:
+                self.__cache.popitem(last=False)
+        else:
+            self.__cache.move_to_end(text)
+
+        return image
+
+    def get_cached_images(self) -> list[Image.Image]:
+        return list(self.__cache.values())
+
+    def __render(self, text: str) -> Image.Image:
         width_in_pixels = round(self.__font.getlength(text))
 
         # Heuristic for aligning the text vertically